@@ -13,16 +13,10 @@ _NUMPY_COMPAT_ATTRS = {
     'int': np.int_,
 }
 
-_np_getattr_original = getattr(np, '__getattr__', None)
-
-def _np_getattr(attr):
-    if attr in _NUMPY_COMPAT_ATTRS:
-        return _NUMPY_COMPAT_ATTRS[attr]
-    if _np_getattr_original:
-        return _np_getattr_original(attr)
-    raise AttributeError(f"module 'numpy' has no attribute '{attr}'")
-
-np.__getattr__ = _np_getattr
+# Set once at import; vars() avoids going through numpy's own module __getattr__
+for _name, _value in _NUMPY_COMPAT_ATTRS.items():
+    if _name not in vars(np):
+        setattr(np, _name, _value)
 
 # Note: Bokeh 3.0+ compatibility is handled in individual modules
 # Panel (widgets) -> TabPanel (models) import fallback
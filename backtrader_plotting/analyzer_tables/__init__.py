@@ -13,10 +13,15 @@ from .sqn import datatable as sqn
 
 _logger = logging.getLogger(__name__)
 _DATATABLE_FNC_NAME = 'get_analysis_table'
+_injected = False
 
 
 def inject_datatables():
-    """Injects function 'get_analysis_table' to some well-known Analyzer classes."""
+    """Injects function 'get_analysis_table' to some well-known Analyzer classes. Only the first call has an effect."""
+    global _injected
+    if _injected:
+        return
+
     _atables = {
         backtrader.analyzers.sharpe.SharpeRatio: sharperatio,
         backtrader.analyzers.DrawDown: drawdown,
@@ -36,3 +41,5 @@ def inject_datatables():
             _logger.warning(f"Analyzer class '{cls.__name__}' already contains a function 'get_rets_table'. Not overriding.")
             continue
         setattr(cls, _DATATABLE_FNC_NAME, labdict)
+
+    _injected = True
@@ -1,13 +1,182 @@
 import os
-import json
+import orjson
+import random
 import requests
+import socket
+import threading
 import time
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import List, Optional
 import polars as pl
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
 
 PLATFORM_WALLETS = ['0xc5d563a36ae78145c45a50134d48a1215220f80a', '0x4bfb41d5b3570defd03c39a9a4d8de6bd8b8982e']
 
+GAMMA_MARKETS_URL = 'https://gamma-api.polymarket.com/markets'
+
+# Maximum concurrency and global request rate for missing token fetches
+FETCH_WORKERS = 16
+REQUESTS_PER_SECOND = 8
+
+# Token IDs looked up per gamma-api request
+TOKENS_PER_REQUEST = 32
+
+# Column layout of the markets parquet files (also the field order of _parse_market rows)
+MARKET_SCHEMA = {
+    'createdAt': pl.Utf8,
+    'id': pl.Utf8,
+    'question': pl.Utf8,
+    'answer1': pl.Utf8,
+    'answer2': pl.Utf8,
+    'neg_risk': pl.Boolean,
+    'market_slug': pl.Utf8,
+    'token1': pl.Utf8,
+    'token2': pl.Utf8,
+    'condition_id': pl.Utf8,
+    'volume': pl.Utf8,
+    'ticker': pl.Utf8,
+    'closedTime': pl.Utf8
+}
+MARKET_ID_INDEX = list(MARKET_SCHEMA).index('id')
+
+# Pause all workers once fewer than this fraction of the rate limit window is left
+RATE_LIMIT_HEADROOM = 0.1
+
+
+class _TokenBucket:
+    """Thread-safe token bucket limiting the request rate shared by all fetch workers"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._blocked_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def block(self, seconds: float):
+        """Hold back all workers for the given number of seconds (e.g. after a 429)"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+class _AIMDLimiter:
+    """Adaptive concurrency limit shared by all fetch workers.
+    Halves on throttling (429/5xx) and grows additively on success."""
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Block until the number of in-flight requests is below the current limit"""
+        with self._cond:
+            while self._in_flight >= int(self.limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self, throttled: bool = False):
+        with self._cond:
+            self._in_flight -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit * 0.5)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 0.5)
+            self._cond.notify_all()
+
+
+def _backoff(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Exponential backoff with jitter"""
+    return min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+def _respect_rate_limit_headers(response: requests.Response, bucket: _TokenBucket):
+    """Pause all workers before the server starts throttling, based on x-ratelimit-* headers"""
+    try:
+        remaining = float(response.headers['x-ratelimit-remaining'])
+        limit = float(response.headers['x-ratelimit-limit'])
+    except (KeyError, ValueError):
+        return
+
+    if remaining >= limit * RATE_LIMIT_HEADROOM:
+        return
+
+    try:
+        reset = float(response.headers.get('x-ratelimit-reset', 1))
+    except ValueError:
+        reset = 1.0
+    # The reset header is either a delay in seconds or an epoch timestamp
+    if reset > time.time():
+        reset -= time.time()
+    bucket.block(reset)
+
+
+def _retry_after(response: requests.Response, default: float) -> float:
+    """Parse the Retry-After header (seconds or HTTP date), falling back to default"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+# Keep idle pooled connections alive so the gamma-api host does not drop them between calls
+_KEEPALIVE_SOCKET_OPTIONS = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+if hasattr(socket, 'TCP_KEEPIDLE'):
+    _KEEPALIVE_SOCKET_OPTIONS += [
+        (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60),
+        (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10),
+    ]
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter whose pooled connections have TCP keepalive enabled"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = HTTPConnection.default_socket_options + _KEEPALIVE_SOCKET_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
+
+# Shared across calls so pooled connections and TLS sessions survive between fetches.
+# The adapter only retries connect/read errors: 429/5xx go straight to _fetch_markets
+# so the AIMD limiter and token bucket see throttling on the first response.
+_SESSION = requests.Session()
+_SESSION.mount('https://', _KeepAliveAdapter(
+    pool_connections=32,
+    pool_maxsize=32,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        respect_retry_after_header=False
+    )
+))
+
 
 def get_markets(main_file: str = "data/markets.parquet", missing_file: str = "data/missing_markets.parquet"):
     """
@@ -18,35 +187,177 @@ def get_markets(main_file: str = "data/markets.parquet", missing_file: str = "da
         main_file: Path to main markets parquet file (default: data/markets.parquet)
         missing_file: Path to missing markets parquet file (default: data/missing_markets.parquet)
     """
-    dfs = []
-
-    # Load main markets file
-    if os.path.exists(main_file):
-        main_df = pl.read_parquet(main_file)
-        dfs.append(main_df)
-        print(f"Loaded {len(main_df)} markets from {main_file}")
+    existing_paths = [p for p in (main_file, missing_file) if os.path.exists(p)]
 
-    # Load missing markets file
-    if os.path.exists(missing_file):
-        missing_df = pl.read_parquet(missing_file)
-        dfs.append(missing_df)
-        print(f"Loaded {len(missing_df)} markets from {missing_file}")
-
-    if not dfs:
+    if not existing_paths:
         print("No market files found!")
         return pl.DataFrame()
 
-    # Combine, deduplicate, and sort
+    for path in existing_paths:
+        # Row count comes from the parquet metadata, no data is read
+        row_count = pl.scan_parquet(path).select(pl.len()).collect().item()
+        print(f"Loaded {row_count} markets from {path}")
+
+    # Combine, deduplicate, and sort lazily so both files are not materialized twice
     combined_df = (
-        pl.concat(dfs)
+        pl.scan_parquet(existing_paths)
         .unique(subset=['id'], keep='first')
         .sort('createdAt')
+        .collect(streaming=True)
     )
 
     print(f"Combined total: {len(combined_df)} unique markets (sorted by createdAt)")
     return combined_df
 
 
+@lru_cache(maxsize=4096)
+def _parse_json_list(value: str) -> tuple:
+    """Parse a JSON-encoded list field (clobTokenIds, outcomes); repeated strings are parsed once"""
+    return tuple(orjson.loads(value))
+
+
+def _parse_market(market: dict, token_id: str) -> Optional[tuple]:
+    """Convert a gamma-api market into a row in MARKET_SCHEMA column order, or None if the token data is invalid"""
+    # Parse clobTokenIds
+    clob_tokens_str = market.get('clobTokenIds', '[]')
+    if isinstance(clob_tokens_str, str):
+        clob_tokens = _parse_json_list(clob_tokens_str)
+    else:
+        clob_tokens = clob_tokens_str
+
+    if len(clob_tokens) < 2:
+        print(f"Invalid token data for {token_id}")
+        return None
+
+    token1, token2 = clob_tokens[0], clob_tokens[1]
+
+    # Parse outcomes
+    outcomes_str = market.get('outcomes', '[]')
+    if isinstance(outcomes_str, str):
+        outcomes = _parse_json_list(outcomes_str)
+    else:
+        outcomes = outcomes_str
+
+    answer1 = outcomes[0] if len(outcomes) > 0 else 'YES'
+    answer2 = outcomes[1] if len(outcomes) > 1 else 'NO'
+
+    # Check for negative risk
+    neg_risk = market.get('negRiskAugmented', False) or market.get('negRiskOther', False)
+
+    # Get ticker from events if available
+    ticker = ''
+    if market.get('events') and len(market.get('events', [])) > 0:
+        ticker = market['events'][0].get('ticker', '')
+
+    question_text = market.get('question', '') or market.get('title', '')
+
+    return (
+        market.get('createdAt', ''),
+        market.get('id', ''),
+        question_text,
+        answer1,
+        answer2,
+        neg_risk,
+        market.get('slug', ''),
+        token1,
+        token2,
+        market.get('conditionId', ''),
+        market.get('volume', ''),
+        ticker,
+        market.get('closedTime', '')
+    )
+
+
+def _fetch_markets(session: requests.Session, bucket: _TokenBucket, limiter: _AIMDLimiter, token_ids: List[str], max_retries: int = 3) -> Optional[list]:
+    """Fetch the raw markets for a batch of token IDs in a single request. Runs on a worker thread."""
+    retry_count = 0
+    throttle_count = 0
+    params = [('clob_token_ids', token_id) for token_id in token_ids] + [('limit', len(token_ids))]
+
+    while retry_count < max_retries:
+        limiter.acquire()
+        bucket.acquire()
+        throttled = False
+        delay = 0.0
+        try:
+            response = session.get(GAMMA_MARKETS_URL, params=params, timeout=60)
+            _respect_rate_limit_headers(response, bucket)
+
+            if response.status_code == 429:
+                throttled = True
+                wait = _retry_after(response, _backoff(throttle_count))
+                throttle_count += 1
+                print(f"Rate limited - waiting {wait:.1f} seconds...")
+                bucket.block(wait)
+            elif response.status_code != 200:
+                throttled = response.status_code >= 500
+                print(f"API error {response.status_code} for {len(token_ids)} token(s)")
+                retry_count += 1
+                delay = _backoff(retry_count)
+            else:
+                markets = orjson.loads(response.content)
+                if isinstance(markets, list):
+                    return markets
+                print(f"Unexpected response body for {len(token_ids)} token(s): {type(markets).__name__}")
+                retry_count += 1
+                delay = _backoff(retry_count)
+
+        except Exception as e:
+            print(f"Error fetching {len(token_ids)} token(s): {e}")
+            retry_count += 1
+            delay = _backoff(retry_count)
+        finally:
+            limiter.release(throttled)
+
+        time.sleep(delay)
+
+    print(f"Failed to fetch {len(token_ids)} token(s) after {max_retries} retries")
+    return None
+
+
+def _fetch_token_batch(session: requests.Session, bucket: _TokenBucket, limiter: _AIMDLimiter, token_ids: List[str]) -> List[tuple]:
+    """
+    Fetch the markets for a batch of token IDs and match them back to the tokens.
+    Tokens missing from the batched response are retried one at a time.
+    Returns a list of (token_id, market_row) tuples.
+    """
+    print(f"Fetching markets for {len(token_ids)} token(s)")
+
+    markets_by_token = {}
+    for market in _fetch_markets(session, bucket, limiter, token_ids) or []:
+        # Skip malformed markets rather than failing the whole batch
+        try:
+            clob_tokens = market.get('clobTokenIds') or '[]'
+            if isinstance(clob_tokens, str):
+                clob_tokens = _parse_json_list(clob_tokens)
+            for clob_token in clob_tokens:
+                markets_by_token[clob_token] = market
+        except (AttributeError, TypeError, ValueError):
+            continue
+
+    results = []
+    for token_id in token_ids:
+        market = markets_by_token.get(token_id)
+        if market is None and len(token_ids) > 1:
+            markets = _fetch_markets(session, bucket, limiter, [token_id])
+            market = markets[0] if markets and isinstance(markets[0], dict) else None
+
+        if market is None:
+            print(f"No market found for token {token_id}")
+            continue
+
+        try:
+            market_row = _parse_market(market, token_id)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Error processing market {market.get('id', 'unknown')} for token {token_id}: {e}")
+            continue
+
+        if market_row is not None:
+            results.append((token_id, market_row))
+
+    return results
+
+
 def update_missing_tokens(missing_token_ids: List[str], parquet_filename: str = "data/missing_markets.parquet"):
     """
     Fetch market data for missing token IDs and save to separate parquet file
@@ -64,6 +375,7 @@ def update_missing_tokens(missing_token_ids: List[str], parquet_filename: str =
     # Check if file exists
     file_exists = os.path.exists(parquet_filename)
 
+    # New markets are accumulated as rows in MARKET_SCHEMA column order
     new_markets = []
     processed_market_ids = set()
 
@@ -82,122 +394,37 @@ def update_missing_tokens(missing_token_ids: List[str], parquet_filename: str =
     # Ensure parent directory exists
     Path(parquet_filename).parent.mkdir(parents=True, exist_ok=True)
 
-    for token_id in missing_token_ids:
-        print(f"Fetching market for token: {token_id}")
+    session = _SESSION
+    bucket = _TokenBucket(REQUESTS_PER_SECOND)
+    limiter = _AIMDLimiter(FETCH_WORKERS)
 
-        retry_count = 0
-        max_retries = 3
+    token_batches = [
+        missing_token_ids[i:i + TOKENS_PER_REQUEST]
+        for i in range(0, len(missing_token_ids), TOKENS_PER_REQUEST)
+    ]
 
-        while retry_count < max_retries:
-            try:
-                response = requests.get(
-                    'https://gamma-api.polymarket.com/markets',
-                    params={'clob_token_ids': token_id},
-                    timeout=30
-                )
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        results = executor.map(lambda token_ids: _fetch_token_batch(session, bucket, limiter, token_ids), token_batches)
 
-                if response.status_code == 429:
-                    print(f"Rate limited - waiting 10 seconds...")
-                    time.sleep(10)
-                    continue
-                elif response.status_code != 200:
-                    print(f"API error {response.status_code} for token {token_id}")
-                    retry_count += 1
-                    time.sleep(2)
-                    continue
-
-                markets = response.json()
-
-                if not markets:
-                    print(f"No market found for token {token_id}")
-                    break
-
-                market = markets[0]
-                market_id = market.get('id', '')
+        for batch_results in results:
+            for token_id, market_row in batch_results:
+                market_id = market_row[MARKET_ID_INDEX]
 
                 # Skip if we already have this market
                 if market_id in processed_market_ids:
                     print(f"Market {market_id} already exists - skipping")
-                    break
-
-                # Parse clobTokenIds
-                clob_tokens_str = market.get('clobTokenIds', '[]')
-                if isinstance(clob_tokens_str, str):
-                    clob_tokens = json.loads(clob_tokens_str)
-                else:
-                    clob_tokens = clob_tokens_str
-
-                if len(clob_tokens) < 2:
-                    print(f"Invalid token data for {token_id}")
-                    break
-
-                token1, token2 = clob_tokens[0], clob_tokens[1]
-
-                # Parse outcomes
-                outcomes_str = market.get('outcomes', '[]')
-                if isinstance(outcomes_str, str):
-                    outcomes = json.loads(outcomes_str)
-                else:
-                    outcomes = outcomes_str
-
-                answer1 = outcomes[0] if len(outcomes) > 0 else 'YES'
-                answer2 = outcomes[1] if len(outcomes) > 1 else 'NO'
-
-                # Check for negative risk
-                neg_risk = market.get('negRiskAugmented', False) or market.get('negRiskOther', False)
-
-                # Get ticker from events if available
-                ticker = ''
-                if market.get('events') and len(market.get('events', [])) > 0:
-                    ticker = market['events'][0].get('ticker', '')
-
-                question_text = market.get('question', '') or market.get('title', '')
-
-                # Create market dictionary
-                market_dict = {
-                    'createdAt': market.get('createdAt', ''),
-                    'id': market_id,
-                    'question': question_text,
-                    'answer1': answer1,
-                    'answer2': answer2,
-                    'neg_risk': neg_risk,
-                    'market_slug': market.get('slug', ''),
-                    'token1': token1,
-                    'token2': token2,
-                    'condition_id': market.get('conditionId', ''),
-                    'volume': market.get('volume', ''),
-                    'ticker': ticker,
-                    'closedTime': market.get('closedTime', '')
-                }
-
-                new_markets.append(market_dict)
+                    continue
+
+                new_markets.append(market_row)
                 processed_market_ids.add(market_id)
                 print(f"Successfully fetched market {market_id} for token {token_id}")
-                break
-
-            except Exception as e:
-                print(f"Error fetching token {token_id}: {e}")
-                retry_count += 1
-                time.sleep(2)
-
-        if retry_count >= max_retries:
-            print(f"Failed to fetch token {token_id} after {max_retries} retries")
-
-        # Small delay between requests
-        time.sleep(0.5)
 
     if not new_markets:
         print("No new markets to add")
         return
 
-    # Convert to DataFrame and save
-    new_df = pl.DataFrame(new_markets)
-
-    # Ensure token columns are strings for long IDs
-    new_df = new_df.with_columns([
-        pl.col("token1").cast(pl.Utf8),
-        pl.col("token2").cast(pl.Utf8)
-    ])
+    # Convert to DataFrame and save (explicit schema keeps long token IDs as strings)
+    new_df = pl.DataFrame(new_markets, schema=MARKET_SCHEMA, orient='row', strict=False)
 
     if existing_df is not None:
         # Append to existing data
@@ -0,0 +1,33 @@
+import os
+import glob
+import polars as pl
+from datetime import datetime, timezone
+
+# Hive-partitioned dataset: goldsky/orderFilled/date=YYYY-MM-DD/part-*.parquet
+ORDER_FILLED_DIR = 'goldsky/orderFilled'
+# Single-file dataset written by earlier versions; still read, never rewritten.
+# It has no 'id' column, so it is scanned separately from the partition files.
+LEGACY_ORDER_FILLED_FILE = 'goldsky/orderFilled.parquet'
+
+def partition_files(since_ts=None):
+    """Parquet files of the partitioned orderFilled dataset, in chronological order.
+    With since_ts, date partitions entirely before that unix timestamp are skipped."""
+    files = sorted(glob.glob(f'{ORDER_FILLED_DIR}/**/*.parquet', recursive=True))
+    if since_ts is not None:
+        since_dir = 'date=' + datetime.fromtimestamp(since_ts, tz=timezone.utc).strftime('%Y-%m-%d')
+        files = [f for f in files if os.path.basename(os.path.dirname(f)) >= since_dir]
+    return files
+
+def scan_order_filled():
+    """LazyFrame over the whole orderFilled dataset (legacy file first, then partitions),
+    or None if nothing has been scraped yet. Legacy rows have a null 'id'."""
+    frames = []
+    if os.path.isfile(LEGACY_ORDER_FILLED_FILE):
+        # Match the all-string schema of the partition files
+        frames.append(pl.scan_parquet(LEGACY_ORDER_FILLED_FILE).with_columns(pl.all().cast(pl.Utf8)))
+    files = partition_files()
+    if files:
+        frames.append(pl.scan_parquet(files))
+    if not frames:
+        return None
+    return pl.concat(frames, how='diagonal')
@@ -7,6 +7,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import polars as pl
 from poly_utils.utils import get_markets, update_missing_tokens
+from update_utils.order_filled import ORDER_FILLED_DIR, scan_order_filled
 from pathlib import Path
 
 def get_processed_df(df):
@@ -106,14 +107,13 @@ def process_live():
     print("=" * 60)
 
     last_processed = {}
-    existing_processed_df = None
+    processed_exists = os.path.exists(processed_file)
 
-    if os.path.exists(processed_file):
+    if processed_exists:
         print(f"✓ Found existing processed file: {processed_file}")
-        existing_processed_df = pl.read_parquet(processed_file)
 
-        # Get last record
-        last_row = existing_processed_df[-1]
+        # Get last record (without loading the whole file)
+        last_row = pl.scan_parquet(processed_file).tail(1).collect()
         last_processed['timestamp'] = last_row['timestamp'][0]
         last_processed['transactionHash'] = last_row['transactionHash'][0]
         last_processed['maker'] = last_row['maker'][0]
@@ -124,7 +124,12 @@ def process_live():
     else:
         print("⚠ No existing processed file found - processing from beginning")
 
-    print(f"\n📂 Reading: goldsky/orderFilled.parquet")
+    print(f"\n📂 Reading: {ORDER_FILLED_DIR}")
+
+    order_filled = scan_order_filled()
+    if order_filled is None:
+        print("⚠ No goldsky data found - run update_goldsky() first")
+        return
 
     schema_overrides = {
         "takerAssetId": pl.Utf8,
@@ -135,7 +140,7 @@ def process_live():
     if last_processed:
         # Only load rows after last processed timestamp
         df = (
-            pl.scan_parquet("goldsky/orderFilled.parquet")
+            order_filled
             .with_columns(
                 pl.from_epoch(pl.col('timestamp'), time_unit='s').alias('timestamp')
             )
@@ -145,7 +150,7 @@ def process_live():
         print(f"✓ Loaded {len(df):,} rows (filtered by timestamp)")
     else:
         # First run - load everything with streaming
-        df = pl.scan_parquet("goldsky/orderFilled.parquet").collect(streaming=True)
+        df = order_filled.collect(streaming=True)
         df = df.with_columns(
             pl.from_epoch(pl.col('timestamp'), time_unit='s').alias('timestamp')
         )
@@ -186,10 +191,11 @@ def process_live():
 
     op_file = 'processed/trades.parquet'
 
-    if existing_processed_df is not None:
-        # Append to existing data
-        combined_df = pl.concat([existing_processed_df, new_df])
-        combined_df.write_parquet(op_file)
+    if processed_exists:
+        # Append to existing data as a streaming pass - the existing file is never fully in memory
+        tmp_file = op_file + '.tmp'
+        pl.concat([pl.scan_parquet(op_file), new_df.lazy()]).sink_parquet(tmp_file)
+        os.replace(tmp_file, op_file)
         print(f"✓ Appended {len(new_df):,} rows to {op_file}")
     else:
         new_df.write_parquet(op_file)
@@ -1,19 +1,46 @@
 import os
 import json
 import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
 from gql import gql, Client
 from gql.transport.requests import RequestsHTTPTransport
-from flatten_json import flatten
+from gql.transport.exceptions import TransportQueryError
 from datetime import datetime, timezone
 import time
 from pathlib import Path
 from update_utils.update_markets import update_markets
+from update_utils.order_filled import ORDER_FILLED_DIR, LEGACY_ORDER_FILLED_FILE, partition_files, scan_order_filled
 
 # Global runtime timestamp - set once when program starts
 RUNTIME_TIMESTAMP = datetime.now().strftime('%Y%m%d_%H%M%S')
 
-# Columns to save
-COLUMNS_TO_SAVE = ['timestamp', 'maker', 'makerAssetId', 'makerAmountFilled', 'taker', 'takerAssetId', 'takerAmountFilled', 'transactionHash']
+# Columns to save ('id' is kept so rows can be deduplicated across runs)
+COLUMNS_TO_SAVE = ['timestamp', 'maker', 'makerAssetId', 'makerAmountFilled', 'taker', 'takerAssetId', 'takerAmountFilled', 'transactionHash', 'id']
+
+# Schema of the orderFilledEvents fields selected in the query (all flat scalars)
+GOLDSKY_SCHEMA = {
+    'fee': pl.Utf8,
+    'id': pl.Utf8,
+    'maker': pl.Utf8,
+    'makerAmountFilled': pl.Utf8,
+    'makerAssetId': pl.Utf8,
+    'orderHash': pl.Utf8,
+    'taker': pl.Utf8,
+    'takerAmountFilled': pl.Utf8,
+    'takerAssetId': pl.Utf8,
+    'timestamp': pl.Utf8,
+    'transactionHash': pl.Utf8
+}
+
+# All saved columns come back from the subgraph as strings (BigInt/Bytes/ID)
+PARQUET_SCHEMA = pa.schema([(col, pa.large_string()) for col in COLUMNS_TO_SAVE])
+
+# Parquet encoding: zstd over dictionary-encoded hex columns, large row groups
+PARQUET_COMPRESSION = 'zstd'
+PARQUET_COMPRESSION_LEVEL = 3
+PARQUET_ROW_GROUP_SIZE = 131072
+DICTIONARY_COLUMNS = ['maker', 'taker', 'makerAssetId', 'takerAssetId', 'transactionHash']
 
 if not os.path.isdir('goldsky'):
     os.mkdir('goldsky')
@@ -54,22 +81,22 @@ def get_latest_cursor():
         except Exception as e:
             print(f"Error reading cursor file: {e}")
 
-    # Fallback: read from parquet file
-    cache_file = 'goldsky/orderFilled.parquet'
+    # Fallback: read from the parquet dataset
+    lf = scan_order_filled()
 
-    if not os.path.isfile(cache_file):
+    if lf is None:
         print("No existing file found, starting from beginning of time (timestamp 0)")
         return 0, None, None
 
     try:
-        # Read parquet file and get last timestamp
-        df = pl.read_parquet(cache_file)
-        if len(df) > 0 and 'timestamp' in df.columns:
-            last_timestamp = df['timestamp'][-1]
-            readable_time = datetime.fromtimestamp(int(last_timestamp), tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
-            print(f'Resuming from parquet (no cursor file): timestamp {last_timestamp} ({readable_time})')
+        # Only the timestamp column is read; cast so the max is numeric, not lexicographic,
+        # and does not depend on row order
+        max_ts = lf.select(pl.col('timestamp').cast(pl.Int64).max()).collect().item()
+        if max_ts is not None:
+            readable_time = datetime.fromtimestamp(max_ts, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
+            print(f'Resuming from parquet (no cursor file): timestamp {max_ts} ({readable_time})')
             # Go back 1 second to ensure no data loss (may create some duplicates)
-            return int(last_timestamp) - 1, None, None
+            return max_ts - 1, None, None
     except Exception as e:
         print(f"Error reading parquet file: {e}")
 
@@ -77,6 +104,67 @@ def get_latest_cursor():
     print("Falling back to beginning of time (timestamp 0)")
     return 0, None, None
 
+def write_partitions(batch_buffer, batch_number):
+    """Write buffered batches as new files under ORDER_FILLED_DIR, one per UTC date.
+    Existing files are never read or rewritten. Returns the number of records written."""
+    buffer_combined = pl.concat(batch_buffer)
+    dates = buffer_combined.select(
+        pl.from_epoch(pl.col('timestamp').cast(pl.Int64), time_unit='s').dt.strftime('%Y-%m-%d')
+    ).to_series()
+
+    for date in dates.unique(maintain_order=True):
+        part = buffer_combined.filter(dates == date)
+        part_dir = Path(ORDER_FILLED_DIR) / f'date={date}'
+        part_dir.mkdir(parents=True, exist_ok=True)
+        # Name starts with the first timestamp so files sort chronologically within a date
+        part_file = part_dir / f"part-{part['timestamp'].cast(pl.Int64).min()}-{RUNTIME_TIMESTAMP}-{batch_number:06d}.parquet"
+        tmp_file = str(part_file) + '.tmp'
+
+        pq.write_table(
+            part.to_arrow().cast(PARQUET_SCHEMA),
+            tmp_file,
+            compression=PARQUET_COMPRESSION,
+            compression_level=PARQUET_COMPRESSION_LEVEL,
+            use_dictionary=DICTIONARY_COLUMNS,
+            row_group_size=PARQUET_ROW_GROUP_SIZE
+        )
+        os.replace(tmp_file, part_file)
+
+    return len(buffer_combined)
+
+ORDER_FILLED_FIELDS = '''
+    fee
+    id
+    maker
+    makerAmountFilled
+    makerAssetId
+    orderHash
+    taker
+    takerAmountFilled
+    takerAssetId
+    timestamp
+    transactionHash
+'''
+
+# Parsed once; the cursor is passed in as variables on every request
+NORMAL_QUERY = gql('''query OrderFilled($first: Int!, $ts: BigInt!) {
+    orderFilledEvents(orderBy: timestamp, orderDirection: asc, first: $first,
+                      where: {timestamp_gt: $ts}) {''' + ORDER_FILLED_FIELDS + '''}
+}''')
+
+# Sticky mode pins one timestamp and paginates by id
+STICKY_QUERY = gql('''query OrderFilledSticky($first: Int!, $ts: BigInt!, $id: ID!) {
+    orderFilledEvents(orderBy: id, orderDirection: asc, first: $first,
+                      where: {timestamp: $ts, id_gt: $id}) {''' + ORDER_FILLED_FIELDS + '''}
+}''')
+
+def connect_client(query_url):
+    """Open a persistent gql session so the HTTP connection is reused across batches.
+    Returns (client, session); call client.close_sync() when done."""
+    transport = RequestsHTTPTransport(url=query_url, verify=True, retries=3)
+    client = Client(transport=transport, fetch_schema_from_transport=False)
+    return client, client.connect_sync()
+
 def scrape(at_once=1000):
     QUERY_URL = "https://api.goldsky.com/api/public/project_cl6mb8i9h0003e201j6li0diw/subgraphs/orderbook-subgraph/0.0.1/gn"
     print(f"Query URL: {QUERY_URL}")
@@ -89,62 +177,77 @@ def scrape(at_once=1000):
 
     print(f"\nStarting scrape for orderFilledEvents")
 
-    output_file = 'goldsky/orderFilled.parquet'
-    print(f"Output file: {output_file}")
+    print(f"Output directory: {ORDER_FILLED_DIR}")
     print(f"Saving columns: {COLUMNS_TO_SAVE}")
 
     # Ensure directory exists
-    Path(output_file).parent.mkdir(parents=True, exist_ok=True)
-
-    # Load existing data if available
-    if os.path.exists(output_file):
-        existing_df = pl.read_parquet(output_file)
+    Path(ORDER_FILLED_DIR).mkdir(parents=True, exist_ok=True)
+
+    # Ids already written - new batches are anti-joined against this frame so
+    # checkpoints never have to deduplicate against the whole dataset. The query
+    # only returns events at or after the resume timestamp, so only that window
+    # of the dataset is loaded. Later batches never overlap earlier ones (the
+    # cursor only moves forward), so the frame does not grow during the run
+    resume_ts = sticky_timestamp if sticky_timestamp is not None else last_timestamp
+    files = partition_files(since_ts=resume_ts)
+    if files:
+        seen_df = (
+            pl.scan_parquet(files)
+            .filter(pl.col('timestamp').cast(pl.Int64) >= resume_ts)
+            .select('id')
+            .collect(streaming=True)
+        )
     else:
-        existing_df = None
+        seen_df = pl.DataFrame(schema={'id': pl.Utf8})
+
+    # The legacy file has no ids. Resuming from its max timestamp re-fetches the
+    # events of that last second, so legacy rows in the same window are matched
+    # on every saved column instead
+    legacy_keys = [col for col in COLUMNS_TO_SAVE if col != 'id']
+    if os.path.isfile(LEGACY_ORDER_FILLED_FILE):
+        legacy_tail = (
+            pl.scan_parquet(LEGACY_ORDER_FILLED_FILE)
+            .select(legacy_keys)
+            .with_columns(pl.all().cast(pl.Utf8))
+            .filter(pl.col('timestamp').cast(pl.Int64) >= resume_ts)
+            .collect()
+        )
+    else:
+        legacy_tail = pl.DataFrame(schema={col: pl.Utf8 for col in legacy_keys})
 
-    # Batch buffer - accumulate batches before writing (reduces write amplification for GB files)
+    # Batch buffer - accumulate batches before writing (fewer, larger files)
     batch_buffer = []
     WRITE_EVERY_N_BATCHES = 10  # Write every 10 batches to reduce disk I/O
+    written_records = 0
+
+    client, gql_session = connect_client(QUERY_URL)
 
     while True:
-        # Build the where clause based on cursor state
+        # Pick the pre-parsed query for the cursor state
         if sticky_timestamp is not None:
             # We're in sticky mode: stay at this timestamp and paginate by id
-            where_clause = f'timestamp: "{sticky_timestamp}", id_gt: "{last_id}"'
+            query = STICKY_QUERY
+            variables = {'first': at_once, 'ts': str(sticky_timestamp), 'id': last_id}
         else:
             # Normal mode: advance by timestamp
-            where_clause = f'timestamp_gt: "{last_timestamp}"'
-        
-        q_string = '''query MyQuery {
-                        orderFilledEvents(orderBy: timestamp, orderDirection: asc
-                                             first: ''' + str(at_once) + '''
-                                             where: {''' + where_clause + '''}) {
-                            fee
-                            id
-                            maker
-                            makerAmountFilled
-                            makerAssetId
-                            orderHash
-                            taker
-                            takerAmountFilled
-                            takerAssetId
-                            timestamp
-                            transactionHash
-                        }
-                    }
-                '''
-
-        query = gql(q_string)
-        transport = RequestsHTTPTransport(url=QUERY_URL, verify=True, retries=3)
-        client = Client(transport=transport)
+            query = NORMAL_QUERY
+            variables = {'first': at_once, 'ts': str(last_timestamp)}
         
         try:
-            res = client.execute(query)
-        except Exception as e:
+            res = gql_session.execute(query, variable_values=variables)
+        except TransportQueryError as e:
             print(f"Query error: {e}")
             print("Retrying in 5 seconds...")
             time.sleep(5)
             continue
+        except Exception as e:
+            # Transport-level failure - rebuild the connection before retrying
+            print(f"Query error: {e}")
+            print("Reconnecting and retrying in 5 seconds...")
+            client.close_sync()
+            time.sleep(5)
+            client, gql_session = connect_client(QUERY_URL)
+            continue
         
         if not res['orderFilledEvents'] or len(res['orderFilledEvents']) == 0:
             if sticky_timestamp is not None:
@@ -156,14 +259,14 @@ def scrape(at_once=1000):
             print(f"No more data for orderFilledEvents")
             break
 
-        # Convert to polars DataFrame
-        df = pl.DataFrame([flatten(x) for x in res['orderFilledEvents']])
-
-        # Sort by timestamp and id for consistent ordering
-        df = df.sort(['timestamp', 'id'])
+        # Convert to polars DataFrame (response is already flat, schema is known)
+        df = pl.from_dicts(res['orderFilledEvents'], schema=GOLDSKY_SCHEMA)
 
+        # Rows arrive in timestamp order (id order in sticky mode, where the timestamp
+        # is fixed), so no re-sort is needed. The sticky cursor needs the highest id at
+        # the last timestamp, which a filter + max finds without sorting the batch.
         batch_last_timestamp = int(df['timestamp'][-1])
-        batch_last_id = df['id'][-1]
+        batch_last_id = df.filter(pl.col('timestamp') == df['timestamp'][-1])['id'].max()
         batch_first_timestamp = int(df['timestamp'][0])
         
         readable_time = datetime.fromtimestamp(batch_last_timestamp, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
@@ -199,42 +302,29 @@ def scrape(at_once=1000):
         total_records += len(df)
 
         # Remove duplicates (by id to be safe)
-        df = df.unique(subset=['id'])
+        df = df.unique(subset=['id'], maintain_order=True)
 
-        # Filter to only the columns we want to save
-        df_to_save = df.select(COLUMNS_TO_SAVE)
+        # Filter to only the columns we want to save and drop rows we already have
+        df_to_save = df.select(COLUMNS_TO_SAVE).with_columns([
+            # Ensure proper types for long IDs
+            pl.col("makerAssetId").cast(pl.Utf8),
+            pl.col("takerAssetId").cast(pl.Utf8)
+        ])
+        if not seen_df.is_empty():
+            df_to_save = df_to_save.join(seen_df, on='id', how='anti')
+        if not legacy_tail.is_empty():
+            df_to_save = df_to_save.join(legacy_tail, on=legacy_keys, how='anti')
 
         # Add to batch buffer
         batch_buffer.append(df_to_save)
 
         # Write to disk every N batches to reduce write amplification on GB files
         if count % WRITE_EVERY_N_BATCHES == 0 or len(df) < at_once:
-            # Combine buffer batches
-            if len(batch_buffer) > 1:
-                buffer_combined = pl.concat(batch_buffer).unique(subset=['id'])
-            else:
-                buffer_combined = batch_buffer[0]
-
-            # Append to existing data and save
-            if existing_df is not None:
-                combined_df = pl.concat([existing_df, buffer_combined])
-            else:
-                combined_df = buffer_combined
-
-            # Remove duplicates across entire dataset
-            combined_df = combined_df.unique(subset=['id'])
-
-            # Ensure proper types for long IDs
-            combined_df = combined_df.with_columns([
-                pl.col("makerAssetId").cast(pl.Utf8),
-                pl.col("takerAssetId").cast(pl.Utf8)
-            ])
-
-            combined_df.write_parquet(output_file)
-            existing_df = combined_df
+            # Write new partition file(s) - no read, concat or rewrite of existing data
+            written_records += write_partitions(batch_buffer, count)
             batch_buffer = []  # Clear buffer
 
-            print(f"   💾 Checkpoint: Written {len(combined_df):,} total records to disk")
+            print(f"   💾 Checkpoint: Written {written_records:,} new records to {ORDER_FILLED_DIR}")
 
         # Save cursor state for efficient resume (no duplicates on restart)
         save_cursor(last_timestamp, last_id, sticky_timestamp)
@@ -242,26 +332,13 @@ def scrape(at_once=1000):
         if len(df) < at_once and sticky_timestamp is None:
             break
 
+    client.close_sync()
+
     # Write any remaining buffered data before exit
     if len(batch_buffer) > 0:
         print(f"   💾 Writing final {len(batch_buffer)} buffered batch(es)...")
-        if len(batch_buffer) > 1:
-            buffer_combined = pl.concat(batch_buffer).unique(subset=['id'])
-        else:
-            buffer_combined = batch_buffer[0]
-
-        if existing_df is not None:
-            combined_df = pl.concat([existing_df, buffer_combined])
-        else:
-            combined_df = buffer_combined
-
-        combined_df = combined_df.unique(subset=['id'])
-        combined_df = combined_df.with_columns([
-            pl.col("makerAssetId").cast(pl.Utf8),
-            pl.col("takerAssetId").cast(pl.Utf8)
-        ])
-        combined_df.write_parquet(output_file)
-        print(f"   💾 Final checkpoint: {len(combined_df):,} total records")
+        written_records += write_partitions(batch_buffer, count)
+        print(f"   💾 Final checkpoint: {written_records:,} new records")
 
     # Clear cursor file on successful completion
     if os.path.isfile(CURSOR_FILE):
@@ -269,7 +346,7 @@ def scrape(at_once=1000):
 
     print(f"Finished scraping orderFilledEvents")
     print(f"Total new records: {total_records}")
-    print(f"Output file: {output_file}")
+    print(f"Output directory: {ORDER_FILLED_DIR}")
 
 def update_goldsky():
     """Run scraping for orderFilledEvents"""